@@ -4,13 +4,13 @@ Create MongoDB indexes from JSON file.
 Usage: python 03_create_mongodb_indexes.py
 """
 
-import subprocess
 import sys
-import json
 import time
 import os
-import tempfile
+import orjson
 from dotenv import load_dotenv
+from pymongo import MongoClient, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
 
 
 def load_config():
@@ -27,66 +27,86 @@ def load_config():
 def create_indexes(config):
     print(f"🔧 Reading indexes from {config['indexes_file']}...")
     
-    with open(config['indexes_file'], 'r') as f:
-        indexes = json.load(f)
+    with open(config['indexes_file'], 'rb') as f:
+        indexes = orjson.loads(f.read())
     
     print(f"📋 Found {len(indexes)} indexes to create\n")
     
+    timeout_ms = config['timeout'] * 1000
+    client = MongoClient(
+        config['connection_string'],
+        serverSelectionTimeoutMS=timeout_ms,
+        socketTimeoutMS=timeout_ms
+    )
+    collection = client[config['database']][config['collection']]
+    
     results = []
     
-    for idx in indexes:
-        index_name = idx['name']
-        index_keys = json.dumps(idx['keys'])
+    start_time = time.perf_counter()
+    try:
+        # One listIndexes round trip so repeat runs only build what is missing
+        existing = {i['name'] for i in collection.list_indexes()}
+        
+        todo = []
+        for idx in indexes:
+            if idx['name'] in existing:
+                print(f"⏭️  Exists: {idx['name']}")
+                results.append({'name': idx['name'], 'status': "EXISTS", 'time': 0})
+            else:
+                print(f"🔍 Creating: {idx['name']}")
+                todo.append(idx)
         
-        print(f"🔍 Creating: {index_name}")
-        start_time = time.time()
+        models = [
+            IndexModel(list(idx['keys'].items()), name=idx['name'], background=True)
+            for idx in todo
+        ]
         
+        # Single createIndexes command for the whole list
+        start_time = time.perf_counter()
         try:
-            js_script = f"""
-            var targetDb = db.getSiblingDB('{config['database']}');
-            var result = targetDb.{config['collection']}.createIndex({index_keys}, {{name: "{index_name}", background: true}});
-            print(JSON.stringify(result));
-            """
-            
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False) as f:
-                f.write(js_script)
-                script_file = f.name
-            
-            result = subprocess.run(
-                ['mongosh', config['connection_string'], '--quiet', '--file', script_file],
-                capture_output=True, text=True, timeout=config['timeout']
-            )
-            
-            execution_time = time.time() - start_time
-            
-            if result.returncode == 0:
-                print(f"   ✅ Created ({execution_time:.2f}s)")
-                status = "SUCCESS"
-            else:
-                print(f"   ❌ Failed")
-                status = "ERROR"
-            
-            results.append({
-                'name': index_name,
-                'status': status,
-                'time': round(execution_time, 2)
-            })
+            if models:
+                collection.create_indexes(models)
+                execution_time = time.perf_counter() - start_time
+                print(f"   ✅ Created {len(models)} indexes ({execution_time:.2f}s)")
+                results.extend(
+                    {'name': idx['name'], 'status': "SUCCESS", 'time': round(execution_time, 2)}
+                    for idx in todo
+                )
+        except OperationFailure as e:
+            # One bad definition fails the whole batch; retry one at a time
+            # over the same connection to report which index is at fault
+            print(f"   ⚠️  Batch failed ({e}), creating indexes individually...")
             
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
-            results.append({
-                'name': index_name,
-                'status': "ERROR",
-                'time': round(time.time() - start_time, 2)
-            })
-        finally:
-            try:
-                os.unlink(script_file)
-            except:
-                pass
+            for idx, model in zip(todo, models):
+                start_time = time.perf_counter()
+                try:
+                    collection.create_indexes([model])
+                    execution_time = time.perf_counter() - start_time
+                    print(f"   ✅ Created: {idx['name']} ({execution_time:.2f}s)")
+                    status = "SUCCESS"
+                except PyMongoError as e:
+                    execution_time = time.perf_counter() - start_time
+                    print(f"   ❌ {idx['name']}: {e}")
+                    status = "ERROR"
+                
+                results.append({
+                    'name': idx['name'],
+                    'status': status,
+                    'time': round(execution_time, 2)
+                })
+    except PyMongoError as e:
+        print(f"   ❌ Error: {e}")
+        done = {r['name'] for r in results}
+        results.extend(
+            {'name': idx['name'], 'status': "ERROR", 'time': round(time.perf_counter() - start_time, 2)}
+            for idx in indexes if idx['name'] not in done
+        )
+    finally:
+        client.close()
     
-    successful = len([r for r in results if r['status'] == 'SUCCESS'])
-    print(f"\n📊 Summary: {successful}/{len(results)} indexes created")
+    successful = sum(1 for r in results if r['status'] == 'SUCCESS')
+    skipped = sum(1 for r in results if r['status'] == 'EXISTS')
+    print(f"\n📊 Summary: {successful}/{len(results) - skipped} indexes created, {skipped} already existed")
     
     return True
 
@@ -1,17 +1,17 @@
 """
 Execute MongoDB queries from JSON file and measure performance.
 
-Usage: python 04_run_mongodb_queries.py
+Usage: python 04_query_performance_server_time.py
 """
 
-import subprocess
 import sys
-import json
 import os
 import csv
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
+from pymongo import MongoClient
+from query_spec import load_queries, explain_command
 
 
 def load_config():
@@ -22,42 +22,85 @@ def load_config():
         'collection': os.getenv('MONGODB_COLLECTION', 'applications'),
         'queries_file': os.getenv('QUERIES_FILE', 'data/mongodb_queries.json'),
         'output_file': 'data/Query_Execution_output.csv',
-        'timeout': int(os.getenv('TIMEOUT_SECONDS', '60'))
+        'timeout': int(os.getenv('TIMEOUT_SECONDS', '60')),
+        'workers': int(os.getenv('QUERY_WORKERS', '1'))
     }
 
 
+def server_time_millis(result):
+    """Pull the server execution time out of an explain result."""
+    # Try multiple paths to find execution time
+    if result.get('explainCommandExecTimeMillis'):
+        return result['explainCommandExecTimeMillis']
+    
+    stats = result.get('executionStats', {})
+    if stats.get('executionTimeMillis'):
+        return stats['executionTimeMillis']
+    if stats.get('executionStages', {}).get('executionTimeMillis'):
+        return stats['executionStages']['executionTimeMillis']
+    
+    stages = result.get('stages') or [{}]
+    cursor_stats = stages[0].get('$cursor', {}).get('executionStats', {})
+    return cursor_stats.get('executionTimeMillis', 0)
+
+
+def run_query(db, collection_name, description, spec):
+    """Explain a single query on the shared client and return its result record."""
+    try:
+        result = db.command(
+            'explain', explain_command(spec.get('collection', collection_name), spec),
+            verbosity='executionStats'
+        )
+        return {
+            'description': description,
+            'status': "SUCCESS",
+            'time': round(float(server_time_millis(result)), 3)
+        }
+    except Exception as e:
+        return {
+            'description': description,
+            'status': "ERROR",
+            'time': 0,
+            'error': str(e)
+        }
+
+
 def save_results_to_csv(config, results):
     output_file = config['output_file']
     epoch = int(datetime.now().timestamp())
     column_header = f"{config['collection']}_{epoch}"
+    if config['workers'] > 1:
+        # Concurrent timings include contention; keep them apart from serial runs
+        column_header += f"_{config['workers']}workers"
     
-    # Read existing CSV if it exists
-    existing_data = {}
-    fieldnames = ['Query Description']
+    new_values = {
+        r['description']: r['time'] if r['status'] == 'SUCCESS' else 'ERROR'
+        for r in results
+    }
+    
+    # Read existing CSV rows as plain lists if it exists
+    header = ['Query Description']
+    rows = []
     
     if os.path.exists(output_file):
-        with open(output_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames.copy() if reader.fieldnames else ['Query Description']
-            for row in reader:
-                existing_data[row['Query Description']] = row
-    
-    # Add new column header
-    fieldnames.append(column_header)
-    
-    # Update data with new results
-    for result in results:
-        desc = result['description']
-        if desc not in existing_data:
-            existing_data[desc] = {'Query Description': desc}
-        existing_data[desc][column_header] = result['time'] if result['status'] == 'SUCCESS' else 'ERROR'
+        with open(output_file, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or header
+            rows = [row for row in reader if row]
+    
+    # Add new column, then rows for queries not seen before
+    width = len(header)
+    header.append(column_header)
+    for row in rows:
+        row.extend([''] * (width - len(row)))
+        row.append(new_values.pop(row[0], ''))
+    rows.extend([desc] + [''] * (width - 1) + [value] for desc, value in new_values.items())
     
     # Write updated CSV
     with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for desc in existing_data:
-            writer.writerow(existing_data[desc])
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
     
     print(f"💾 Results saved to: {output_file}")
     print(f"📊 Column: {column_header}")
@@ -66,111 +109,41 @@ def save_results_to_csv(config, results):
 def execute_queries(config):
     print(f"🔧 Reading queries from {config['queries_file']}...")
     
-    with open(config['queries_file'], 'r') as f:
-        queries = json.load(f)
+    queries = load_queries(config['queries_file'])
+    
+    print(f"📋 Found {len(queries)} queries to execute ({config['workers']} workers)\n")
     
-    print(f"📋 Found {len(queries)} queries to execute\n")
+    timeout_ms = config['timeout'] * 1000
+    client = MongoClient(
+        config['connection_string'],
+        maxPoolSize=32,
+        serverSelectionTimeoutMS=timeout_ms,
+        socketTimeoutMS=timeout_ms
+    )
+    db = client[config['database']]
     
     results = []
     
-    for q in queries:
-        description = q['description']
-        query = q['query']
-        
-        # Replace collection placeholder with actual collection from config
-        query = query.replace('{{collection}}', config['collection'])
-        
-        print(f"🔍 {description}")
-        
-        try:
-            # Transform query to get execution stats
-            run_query = query
-            
-            # Handle countDocuments wrapper first
-            if 'countDocuments(' in run_query:
-                # Extract collection and filter for correct explain command
-                import re
-                match = re.search(r'targetDb\.([\w-]+)\.countDocuments\((.*)\)', run_query)
-                if match:
-                    collection = match.group(1)
-                    filter_arg = match.group(2).strip()
-                    if not filter_arg:
-                        filter_arg = "{}"
-                    # Use aggregate explain to get accurate execution time for countDocuments
-                    run_query = f'targetDb.{collection}.explain("executionStats").aggregate([{{$match: {filter_arg}}}, {{$count: "n"}}])'
-
-            # Handle find/aggregate transformations if not already handled as count
-            elif '.toArray()' in run_query:
-                run_query = run_query.replace('.toArray()', '.explain("executionStats")')
-            elif '.find(' in run_query:
-                run_query = run_query.rstrip() + '.explain("executionStats")'
-            elif '.aggregate(' in run_query:
-                 run_query = run_query.rstrip() + '.explain("executionStats")'
-            else:
-                 run_query = run_query + '.explain("executionStats")'
-
-            js_script = f"var targetDb = db.getSiblingDB('{config['database']}');\n"
-            js_script += f"var result = {run_query};\n"
-            js_script += """
-            var timeMillis = 0;
-            
-            // Try multiple paths to find execution time
-            if (result.explainCommandExecTimeMillis) {
-                timeMillis = result.explainCommandExecTimeMillis;
-            } else if (result.executionStats && result.executionStats.executionTimeMillis) {
-                timeMillis = result.executionStats.executionTimeMillis;
-            } else if (result.executionStats && result.executionStats.executionStages && result.executionStats.executionStages.executionTimeMillis) {
-                timeMillis = result.executionStats.executionStages.executionTimeMillis;
-            } else if (result.stages && result.stages.length > 0 && result.stages[0]['$cursor'] && result.stages[0]['$cursor'].executionStats) {
-                timeMillis = result.stages[0]['$cursor'].executionStats.executionTimeMillis;
-            }
-            
-            print('SERVER_TIME:' + timeMillis);
-            """
-            
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False) as f:
-                f.write(js_script)
-                script_file = f.name
-            
-            result = subprocess.run(
-                ['mongosh', config['connection_string'], '--quiet', '--file', script_file],
-                capture_output=True, text=True, timeout=config['timeout']
-            )
-            
-            if result.returncode == 0:
-                db_time = 0
-                for line in result.stdout.split('\n'):
-                    if line.startswith('SERVER_TIME:'):
-                        db_time = float(line.split(':')[1])
-                        break
-                
-                print(f"   ✅ Server Time: {db_time:.3f}ms")
-                status = "SUCCESS"
-            else:
-                print(f"   ❌ Failed: {result.stderr}")
-                status = "ERROR"
-                db_time = 0
-            
-            results.append({
-                'description': description,
-                'status': status,
-                'time': round(db_time, 3)
-            })
+    try:
+        with ThreadPoolExecutor(max_workers=config['workers']) as executor:
+            futures = [
+                executor.submit(run_query, db, config['collection'], q['description'], q['query'])
+                for q in queries
+            ]
             
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
-            results.append({
-                'description': description,
-                'status': "ERROR",
-                'time': 0
-            })
-        finally:
-            try:
-                os.unlink(script_file)
-            except:
-                pass
-    
-    successful = len([r for r in results if r['status'] == 'SUCCESS'])
+            # Report in file order as results arrive
+            for future in futures:
+                result = future.result()
+                print(f"🔍 {result['description']}")
+                if result['status'] == 'SUCCESS':
+                    print(f"   ✅ Server Time: {result['time']:.3f}ms")
+                else:
+                    print(f"   ❌ Failed: {result.pop('error')}")
+                results.append(result)
+    finally:
+        client.close()
+    
+    successful = sum(1 for r in results if r['status'] == 'SUCCESS')
     total_time = sum(r['time'] for r in results)
     avg_time = total_time / len(results) if results else 0
     
@@ -1,17 +1,20 @@
 """
 Generate MongoDB explain output for queries.
 
-Usage: python 05_generate_explain_output.py
+Usage: python 05_generate_explain_plans.py
 """
 
-import subprocess
 import sys
-import json
 import os
-import re
-import tempfile
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from bson import json_util
 from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError, ServerSelectionTimeoutError
+from query_spec import load_queries, format_query, explain_command, shape_key
 
 
 def load_config():
@@ -21,139 +24,122 @@ def load_config():
         'database': os.getenv('MONGODB_DATABASE', 'mobile_apps'),
         'collection': os.getenv('MONGODB_COLLECTION', 'applications'),
         'queries_file': os.getenv('QUERIES_FILE', 'data/mongodb_queries.json'),
-        'timeout': int(os.getenv('EXPLAIN_TIMEOUT_SECONDS', '300'))
+        'timeout': int(os.getenv('EXPLAIN_TIMEOUT_SECONDS', '300')),
+        'dedup_shapes': os.getenv('EXPLAIN_DEDUP_SHAPES', 'false').lower() == 'true',
+        'workers': int(os.getenv('EXPLAIN_WORKERS', '8'))
     }
 
 
-def transform_to_explain(query, explain_mode):
-    """Transform query to use explain."""
-    
-    # countDocuments -> db.runCommand with explain
-    if 'countDocuments(' in query:
-        match = re.search(r'targetDb\.([\w-]+)\.countDocuments\((.*)\)', query)
-        if match:
-            collection = match.group(1)
-            filter_arg = match.group(2)
-            return f'targetDb.runCommand({{explain: {{count: "{collection}", query: {filter_arg}}}, verbosity: "{explain_mode}"}})'
-    
-    # find().toArray() -> find().explain()
-    if '.toArray()' in query:
-        return query.replace('.toArray()', f'.explain("{explain_mode}")')
-    
-    # find() -> find().explain()
-    if '.find(' in query:
-        return query.rstrip() + f'.explain("{explain_mode}")'
-    
-    # aggregate() -> aggregate().explain()
-    if '.aggregate(' in query:
-        return query.rstrip() + f'.explain("{explain_mode}")'
-    
-    # Default: append explain
-    return query + f'.explain("{explain_mode}")'
+def execute_explain(db, command, explain_mode):
+    """Execute explain for a prebuilt query command via PyMongo."""
+    return db.command('explain', command, verbosity=explain_mode)
 
 
-def execute_explain(config, query, explain_mode):
-    """Execute explain query via mongosh."""
-    explain_query = transform_to_explain(query, explain_mode)
-    
-    js_script = f"""
-var targetDb = db.getSiblingDB('{config['database']}');
-var explainResult = {explain_query};
-print(JSON.stringify(explainResult, null, 2));
-"""
-    
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False) as f:
-        f.write(js_script)
-        script_file = f.name
+def explain_query(db, collection_name, spec):
+    """Explain with allPlansExecution, falling back to executionStats on timeout."""
+    outcome = {'mode': 'allPlansExecution', 'result': None, 'error': None, 'fell_back': False}
     
     try:
-        result = subprocess.run(
-            ['mongosh', config['connection_string'], '--quiet', '--file', script_file],
-            capture_output=True, 
-            text=True, 
-            timeout=config['timeout']
-        )
-        return result
-    finally:
-        try:
-            os.unlink(script_file)
-        except:
-            pass
+        # Build the command once; the executionStats retry reuses it as-is
+        command = explain_command(spec.get('collection', collection_name), spec)
+        outcome['result'] = execute_explain(db, command, 'allPlansExecution')
+    except PyMongoError as e:
+        # Only an explain that ran too long is worth retrying in the cheaper mode
+        if not e.timeout or isinstance(e, ServerSelectionTimeoutError):
+            outcome['error'] = str(e)
+        else:
+            outcome.update(mode='executionStats', fell_back=True)
+            try:
+                outcome['result'] = execute_explain(db, command, 'executionStats')
+            except Exception as e:
+                outcome['error'] = str(e)
+    except Exception as e:
+        outcome['error'] = str(e)
+    
+    return outcome
+
+
+def write_explain(out_file, result):
+    """Stream an explain document to the output file as relaxed Extended JSON."""
+    # json.dump writes encoder chunks straight to the file, so large
+    # allPlansExecution payloads are never held as one big string
+    json.dump(result, out_file, indent=2, default=json_util.default)
+    out_file.write("\n")
 
 
 def generate_explain_output(config):
     print(f"🔧 Reading queries from {config['queries_file']}...")
     
-    with open(config['queries_file'], 'r') as f:
-        queries = json.load(f)
+    queries = load_queries(config['queries_file'])
     
-    print(f"📋 Found {len(queries)} queries to explain\n")
+    print(f"📋 Found {len(queries)} queries to explain ({config['workers']} workers)\n")
     
     epoch = int(datetime.now().timestamp())
-    output_file = f"data/explain_out_{epoch}.txt"
-    
-    with open(output_file, 'w', encoding='utf-8') as out_file:
+    output_file = f"data/explain_out_{epoch}.txt.gz"
+    
+    timeout_ms = config['timeout'] * 1000
+    client = MongoClient(
+        config['connection_string'],
+        serverSelectionTimeoutMS=timeout_ms,
+        socketTimeoutMS=timeout_ms
+    )
+    db = client[config['database']]
+    
+    # Explain JSON is highly repetitive; level 1 gzip shrinks it cheaply
+    with client, gzip.open(output_file, 'wt', compresslevel=1, encoding='utf-8') as out_file:
         out_file.write(f"MongoDB Explain Output\n")
         out_file.write(f"Generated: {datetime.now().isoformat()}\n")
         out_file.write(f"Database: {config['database']}\n")
         out_file.write(f"Collection: {config['collection']}\n")
         out_file.write("=" * 80 + "\n\n")
         
-        for idx, q in enumerate(queries, 1):
-            description = q['description']
-            query = q['query'].replace('{{collection}}', config['collection'])
+        with ThreadPoolExecutor(max_workers=config['workers']) as executor:
+            # Submit every query up front; with EXPLAIN_DEDUP_SHAPES=true only
+            # the first query of each shape is explained and later ones reuse it
+            futures = []
+            first_of_shape = {}
+            for idx, q in enumerate(queries, 1):
+                key = shape_key(q['query']) if config['dedup_shapes'] else idx
+                if key not in first_of_shape:
+                    first_of_shape[key] = (idx, executor.submit(
+                        explain_query, db, config['collection'], q['query']
+                    ))
+                futures.append(first_of_shape[key])
             
-            print(f"🔍 [{idx}/{len(queries)}] {description}")
-            
-            out_file.write(f"Query {idx}: {description}\n")
-            out_file.write("-" * 80 + "\n")
-            out_file.write(f"Original Query: {query}\n\n")
-            
-            # Try allPlansExecution first
-            try:
-                result = execute_explain(config, query, 'allPlansExecution')
+            # Write outputs in submission order as they complete
+            for idx, (q, (source_idx, future)) in enumerate(zip(queries, futures), 1):
+                description = q['description']
+                spec = q['query']
                 
-                if result.returncode == 0:
-                    out_file.write(f"Explain Output (mode: allPlansExecution):\n")
-                    out_file.write(result.stdout)
-                    out_file.write("\n")
-                    print(f"   ✅ Captured (allPlansExecution)")
+                print(f"🔍 [{idx}/{len(queries)}] {description}")
+                
+                out_file.write(f"Query {idx}: {description}\n")
+                out_file.write("-" * 80 + "\n")
+                out_file.write(f"Original Query: {format_query(spec)}\n\n")
+                
+                outcome = future.result()
+                cached = source_idx != idx and outcome['error'] is None
+                if source_idx != idx and not cached:
+                    # The shape's first explain failed; try this query on its own
+                    outcome = explain_query(db, config['collection'], spec)
+                
+                if outcome['fell_back'] and not cached:
+                    out_file.write(f"Note: allPlansExecution timed out, using executionStats...\n\n")
+                    print(f"   ⏱️ Timeout, fell back to executionStats")
+                
+                if outcome['error'] is not None:
+                    out_file.write(f"ERROR: {outcome['error']}\n")
+                    print(f"   ❌ Error: {outcome['error']}")
+                elif cached:
+                    out_file.write(f"Explain Output (mode: {outcome['mode']}, cached from query {source_idx} with the same shape):\n")
+                    write_explain(out_file, outcome['result'])
+                    print(f"   ♻️ Reused explain from query {source_idx} (same shape)")
                 else:
-                    # Check if timeout, otherwise show error
-                    if 'timeout' in result.stderr.lower():
-                        raise subprocess.TimeoutExpired(cmd=None, timeout=config['timeout'])
-                    
-                    out_file.write("ERROR:\n")
-                    out_file.write(result.stderr)
-                    out_file.write("\n")
-                    print(f"   ❌ Failed")
-                    
-            except subprocess.TimeoutExpired:
-                # Fallback to executionStats
-                out_file.write(f"Note: allPlansExecution timed out, using executionStats...\n\n")
-                print(f"   ⏱️ Timeout, falling back to executionStats...")
+                    out_file.write(f"Explain Output (mode: {outcome['mode']}):\n")
+                    write_explain(out_file, outcome['result'])
+                    print(f"   ✅ Captured ({outcome['mode']})")
                 
-                try:
-                    result = execute_explain(config, query, 'executionStats')
-                    if result.returncode == 0:
-                        out_file.write(f"Explain Output (mode: executionStats):\n")
-                        out_file.write(result.stdout)
-                        out_file.write("\n")
-                        print(f"   ✅ Captured (executionStats)")
-                    else:
-                        out_file.write("ERROR:\n")
-                        out_file.write(result.stderr)
-                        out_file.write("\n")
-                        print(f"   ❌ Failed")
-                except Exception as e:
-                    out_file.write(f"ERROR: {e}\n")
-                    print(f"   ❌ Error: {e}")
-                    
-            except Exception as e:
-                out_file.write(f"ERROR: {e}\n")
-                print(f"   ❌ Error: {e}")
-            
-            out_file.write("\n" + "=" * 80 + "\n\n")
+                out_file.write("\n" + "=" * 80 + "\n\n")
     
     print(f"\n💾 Explain output saved to: {output_file}")
 
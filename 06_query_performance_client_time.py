@@ -2,17 +2,17 @@
 Execute MongoDB queries directly and measure client-side performance.
 This captures wall-clock time including network latency.
 
-Usage: python 06_run_queries_direct.py
+Usage: python 06_query_performance_client_time.py
 """
 
-import subprocess
 import sys
-import json
 import os
 import csv
-import tempfile
+import time
 from datetime import datetime
 from dotenv import load_dotenv
+from pymongo import MongoClient
+from query_spec import load_queries, run_operation
 
 
 def load_config():
@@ -32,29 +32,31 @@ def save_results_to_csv(config, results):
     epoch = int(datetime.now().timestamp())
     column_header = f"{config['collection']}_direct_{epoch}"
     
-    existing_data = {}
-    fieldnames = ['Query Description']
-    
-    if os.path.exists(output_file):
-        with open(output_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames.copy() if reader.fieldnames else ['Query Description']
-            for row in reader:
-                existing_data[row['Query Description']] = row
+    new_values = {
+        r['description']: r['time'] if r['status'] == 'SUCCESS' else 'ERROR'
+        for r in results
+    }
     
-    fieldnames.append(column_header)
+    header = ['Query Description']
+    rows = []
     
-    for result in results:
-        desc = result['description']
-        if desc not in existing_data:
-            existing_data[desc] = {'Query Description': desc}
-        existing_data[desc][column_header] = result['time'] if result['status'] == 'SUCCESS' else 'ERROR'
+    if os.path.exists(output_file):
+        with open(output_file, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or header
+            rows = [row for row in reader if row]
+    
+    width = len(header)
+    header.append(column_header)
+    for row in rows:
+        row.extend([''] * (width - len(row)))
+        row.append(new_values.pop(row[0], ''))
+    rows.extend([desc] + [''] * (width - 1) + [value] for desc, value in new_values.items())
     
     with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for desc in existing_data:
-            writer.writerow(existing_data[desc])
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
     
     print(f"💾 Results saved to: {output_file}")
     print(f"📊 Column: {column_header}")
@@ -63,74 +65,61 @@ def save_results_to_csv(config, results):
 def execute_queries(config):
     print(f"🔧 Reading queries from {config['queries_file']}...")
     
-    with open(config['queries_file'], 'r') as f:
-        queries = json.load(f)
+    queries = load_queries(config['queries_file'])
     
     print(f"📋 Found {len(queries)} queries to execute\n")
     
+    timeout_ms = config['timeout'] * 1000
+    client = MongoClient(
+        config['connection_string'],
+        serverSelectionTimeoutMS=timeout_ms,
+        socketTimeoutMS=timeout_ms
+    )
+    db = client[config['database']]
+    
     results = []
     
-    for q in queries:
-        description = q['description']
-        query = q['query']
-        
-        query = query.replace('{{collection}}', config['collection'])
-        
-        print(f"🔍 {description}")
-        
+    try:
         try:
-            js_script = (
-                f"var targetDb = db.getSiblingDB('{config['database']}');\n"
-                "var startTime = new Date();\n"
-                f"var result = {query};\n"
-                "var endTime = new Date();\n"
-                "var durationMs = endTime - startTime;\n"
-                "print('DURATION:' + durationMs);\n"
-            )
-            
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False) as f:
-                f.write(js_script)
-                script_file = f.name
+            # Connect up front so the first query isn't charged the handshake
+            client.admin.command('ping')
+        except Exception as e:
+            print(f"   ❌ Connection failed: {e}")
+            return False
+        
+        for q in queries:
+            description = q['description']
+            spec = q['query']
+            collection = db[spec.get('collection', config['collection'])]
             
-            result = subprocess.run(
-                ['mongosh', config['connection_string'], '--quiet', '--file', script_file],
-                capture_output=True, text=True, timeout=config['timeout']
-            )
+            print(f"🔍 {description}")
             
-            if result.returncode == 0:
-                duration_ms = 0
-                for line in result.stdout.split('\n'):
-                    if line.startswith('DURATION:'):
-                        duration_ms = float(line.split(':')[1])
-                        break
+            try:
+                start_time = time.perf_counter()
+                run_operation(collection, spec)
+                duration_ms = (time.perf_counter() - start_time) * 1000
                 
                 print(f"   ✅ Client Time: {duration_ms:.3f}ms")
                 status = "SUCCESS"
-            else:
-                print(f"   ❌ Failed: {result.stderr}")
-                status = "ERROR"
-                duration_ms = 0
-            
-            results.append({
-                'description': description,
-                'status': status,
-                'time': round(duration_ms, 3)
-            })
-            
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
-            results.append({
-                'description': description,
-                'status': "ERROR",
-                'time': 0
-            })
-        finally:
-            try:
-                os.unlink(script_file)
-            except:
-                pass
-    
-    successful = len([r for r in results if r['status'] == 'SUCCESS'])
+                
+                results.append({
+                    'description': description,
+                    'status': status,
+                    'time': round(duration_ms, 3)
+                })
+                
+            except Exception as e:
+                print(f"   ❌ Error: {e}")
+                results.append({
+                    'description': description,
+                    'status': "ERROR",
+                    'time': 0
+                })
+    
+    finally:
+        client.close()
+    
+    successful = sum(1 for r in results if r['status'] == 'SUCCESS')
     total_time = sum(r['time'] for r in results)
     avg_time = total_time / len(results) if results else 0
     
@@ -155,7 +144,8 @@ def main():
         print(f"❌ {config['queries_file']} not found")
         return 1
     
-    execute_queries(config)
+    if not execute_queries(config):
+        return 1
     
     print("=" * 60)
     return 0
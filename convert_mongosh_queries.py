@@ -0,0 +1,336 @@
+"""
+Convert mongosh-style query strings in a queries file into structured specs.
+
+Rewrites each `"query": "targetDb.{{collection}}.find({...}).limit(10).toArray()"`
+entry as `"query": {"op": "find", "args": {"filter": {...}, "limit": 10}}`, the
+form scripts 04-06 dispatch directly through PyMongo (see query_spec.py).
+Entries that are already structured are left untouched.
+
+Usage: python convert_mongosh_queries.py data/mongodb_queries.json [--output FILE]
+"""
+
+import sys
+import json
+import re
+import argparse
+from datetime import datetime, timezone
+from bson import ObjectId, Regex, json_util
+from bson.errors import InvalidId
+from bson.json_util import RELAXED_JSON_OPTIONS
+
+
+_PLACEHOLDER = '__collection_placeholder__'
+
+# Compiled once; matched in place with .match(text, pos) to avoid slicing
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_$][\w$]*')
+_NUMBER_RE = re.compile(r'-?\d+(\.\d+)?([eE][+-]?\d+)?')
+_REGEX_FLAGS_RE = re.compile(r'[a-z]*')
+
+# Single-character JavaScript string escapes; any other escaped character
+# stands for itself (\' -> ', \\ -> \)
+_STRING_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+
+_QUOTES = ('"', "'")
+
+
+class _ShellParser:
+    """Parse the mongosh subset used in the queries file into Python values."""
+    
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+    
+    def error(self, message):
+        raise ValueError(f"{message} at position {self.pos}: {self.text!r}")
+    
+    def skip_ws(self):
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+    
+    def peek(self):
+        self.skip_ws()
+        return self.text[self.pos] if self.pos < len(self.text) else ''
+    
+    def expect(self, char):
+        if self.peek() != char:
+            self.error(f"Expected {char!r}")
+        self.pos += 1
+    
+    def identifier(self):
+        self.skip_ws()
+        match = _IDENTIFIER_RE.match(self.text, self.pos)
+        if not match:
+            self.error("Expected identifier")
+        self.pos = match.end()
+        return match.group(0)
+    
+    def string(self):
+        if self.peek() not in _QUOTES:
+            self.error("Expected string")
+        quote = self.text[self.pos]
+        end = self.pos + 1
+        chars = []
+        while end < len(self.text) and self.text[end] != quote:
+            char = self.text[end]
+            if char == '\\':
+                end += 1
+                if end >= len(self.text):
+                    break
+                char = self.text[end]
+                if char in 'xu':
+                    # \xHH and \uHHHH code points
+                    width = 2 if char == 'x' else 4
+                    digits = self.text[end + 1:end + 1 + width]
+                    if len(digits) != width or not all(d in '0123456789abcdefABCDEF' for d in digits):
+                        self.pos = end
+                        self.error(f"Invalid \\{char} escape")
+                    char = chr(int(digits, 16))
+                    end += width
+                else:
+                    char = _STRING_ESCAPES.get(char, char)
+            chars.append(char)
+            end += 1
+        if end >= len(self.text):
+            self.error("Unterminated string")
+        self.pos = end + 1
+        return ''.join(chars)
+    
+    def value(self):
+        char = self.peek()
+        if not char:
+            self.error("Unexpected end of input")
+        if char == '{':
+            return self.obj()
+        if char == '[':
+            return self.array()
+        if char in _QUOTES:
+            return self.string()
+        if char == '/':
+            end = self.pos + 1
+            while end < len(self.text) and self.text[end] != '/':
+                end += 2 if self.text[end] == '\\' else 1
+            if end >= len(self.text):
+                self.error("Unterminated regex")
+            pattern = self.text[self.pos + 1:end].replace('\\/', '/')
+            self.pos = end + 1
+            flags = _REGEX_FLAGS_RE.match(self.text, self.pos).group(0)
+            self.pos += len(flags)
+            return Regex(pattern, flags)
+        
+        number = _NUMBER_RE.match(self.text, self.pos)
+        if number:
+            self.pos = number.end()
+            return float(number.group(0)) if number.group(1) or number.group(2) else int(number.group(0))
+        
+        name = self.identifier()
+        constructed = name == 'new'
+        if constructed:
+            name = self.identifier()
+        if name in ('true', 'false'):
+            return name == 'true'
+        if name == 'null':
+            return None
+        if name == 'ObjectId':
+            args = self.arguments()
+            try:
+                return ObjectId(*args)
+            except (InvalidId, TypeError) as e:
+                self.error(f"Invalid ObjectId ({e})")
+        if name in ('ISODate', 'Date'):
+            return self.date(name, constructed)
+        self.error(f"Unsupported literal {name!r}")
+    
+    def date(self, name, constructed):
+        # Date() without `new` returns the current time as a string, and an
+        # argument-less date is the conversion time; neither can be stored
+        if name == 'Date' and not constructed:
+            self.error("Date() without 'new' is not a fixed date")
+        args = self.arguments()
+        if len(args) != 1:
+            self.error(f"{name}() needs exactly one argument")
+        value = args[0]
+        try:
+            if isinstance(value, str):
+                return datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                # Milliseconds since the Unix epoch
+                return datetime.fromtimestamp(value / 1000, timezone.utc)
+        except (ValueError, OverflowError, OSError) as e:
+            self.error(f"Invalid {name}() argument ({e})")
+        self.error(f"Unsupported {name}() argument {value!r}")
+    
+    def obj(self):
+        self.expect('{')
+        result = {}
+        while self.peek() != '}':
+            key = self.string() if self.peek() in _QUOTES else self.identifier()
+            self.expect(':')
+            result[key] = self.value()
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect('}')
+        return result
+    
+    def array(self):
+        self.expect('[')
+        result = []
+        while self.peek() != ']':
+            result.append(self.value())
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect(']')
+        return result
+    
+    def arguments(self):
+        self.expect('(')
+        args = []
+        while self.peek() != ')':
+            args.append(self.value())
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect(')')
+        return args
+
+
+def _find(args):
+    spec = {'op': 'find', 'args': {'filter': args[0] if args else {}}}
+    if len(args) > 1:
+        spec['args']['projection'] = args[1]
+    return spec
+
+
+# mongosh collection method -> builder of the equivalent PyMongo spec
+_METHODS = {
+    'find': _find,
+    'countDocuments': lambda args: {'op': 'count_documents', 'args': {'filter': args[0] if args else {}}},
+    'aggregate': lambda args: {'op': 'aggregate', 'args': {'pipeline': args[0] if args else []}},
+    'estimatedDocumentCount': lambda args: {'op': 'estimated_document_count', 'args': {}},
+}
+
+
+def _count(spec, args):
+    # Like mongosh, cursor.count() ignores skip/limit unless applySkipLimit is set
+    spec['op'] = 'count_documents'
+    if not (args and args[0] is True):
+        spec['args'].pop('skip', None)
+        spec['args'].pop('limit', None)
+    spec['args'].pop('projection', None)
+    spec['args'].pop('sort', None)
+
+
+def _set_arg(name):
+    def apply(spec, args):
+        spec['args'][name] = args[0]
+    return apply
+
+
+def _set_key_list(name):
+    def apply(spec, args):
+        value = args[0]
+        spec['args'][name] = list(value.items()) if isinstance(value, dict) else value
+    return apply
+
+
+# Chained cursor modifier -> (ops it may follow, rewrite applied to the spec)
+_MODIFIERS = {
+    'toArray': (('find', 'aggregate'), lambda spec, args: None),
+    'count': (('find',), _count),
+    'limit': (('find',), _set_arg('limit')),
+    'skip': (('find',), _set_arg('skip')),
+    'sort': (('find',), _set_key_list('sort')),
+    'hint': (('find',), _set_key_list('hint')),
+}
+
+
+def parse_query(query):
+    """Translate a `targetDb.<coll>.<method>(...)` mongosh query into an operation spec.
+    
+    Returns {'op': <PyMongo Collection method>, 'args': {...}}, plus 'collection'
+    when the query names a collection instead of the {{collection}} placeholder.
+    """
+    parser = _ShellParser(query.replace('{{collection}}', _PLACEHOLDER))
+    if parser.identifier() != 'targetDb':
+        raise ValueError(f"Unsupported query: {query!r}")
+    parser.expect('.')
+    collection = parser.identifier()
+    if collection == 'getCollection':
+        args = parser.arguments()
+        if len(args) != 1 or not isinstance(args[0], str):
+            parser.error("getCollection() needs one collection name")
+        collection = args[0]
+    parser.expect('.')
+    method = parser.identifier()
+    
+    if method not in _METHODS:
+        raise ValueError(f"Unsupported method {method!r} in query: {query!r}")
+    spec = _METHODS[method](parser.arguments())
+    if collection != _PLACEHOLDER:
+        spec['collection'] = collection
+    
+    # Chained cursor modifiers: .sort(...).limit(...).toArray()
+    while parser.peek() == '.':
+        parser.pos += 1
+        modifier = parser.identifier()
+        modifier_args = parser.arguments()
+        
+        ops, rewrite = _MODIFIERS.get(modifier, ((), None))
+        if spec['op'] not in ops:
+            raise ValueError(f"Unsupported modifier .{modifier}() in query: {query!r}")
+        rewrite(spec, modifier_args)
+    
+    if parser.peek() not in ('', ';'):
+        parser.error("Unexpected trailing input")
+    
+    return spec
+
+
+def dump_queries(queries):
+    """Serialize entries one field per line, keeping each query on a single line."""
+    entries = []
+    for q in queries:
+        fields = [
+            f"        {json.dumps(key)}: {json_util.dumps(value, json_options=RELAXED_JSON_OPTIONS)}"
+            for key, value in q.items()
+        ]
+        entries.append("    {\n" + ",\n".join(fields) + "\n    }")
+    return "[\n" + ",\n".join(entries) + "\n]\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert mongosh query strings into structured query specs')
+    parser.add_argument('queries_file', help='Queries JSON file to convert')
+    parser.add_argument('--output', help='Output file (default: overwrite the input file)')
+    args = parser.parse_args()
+    
+    with open(args.queries_file, 'r', encoding='utf-8') as f:
+        queries = json.load(f)
+    
+    converted = 0
+    errors = 0
+    for q in queries:
+        if not isinstance(q.get('query'), str):
+            continue
+        try:
+            q['query'] = parse_query(q['query'])
+            converted += 1
+        except Exception as e:
+            print(f"❌ {q.get('description')}: {e}")
+            errors += 1
+    
+    if errors:
+        print(f"\n❌ {errors} queries could not be converted; no changes written")
+        return 1
+    
+    output_file = args.output or args.queries_file
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(dump_queries(queries))
+    
+    print(f"✅ Converted {converted}/{len(queries)} queries -> {output_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Shared helpers for the structured query files used by scripts 04-06.
+
+Each entry in data/mongodb_queries.json holds a `query` object of the form
+{"op": <PyMongo Collection method>, "args": {...}} with values in MongoDB
+Extended JSON (e.g. {"$date": "2024-01-01T00:00:00Z"}). An optional
+"collection" key overrides MONGODB_COLLECTION for that query.
+
+Convert mongosh-style query strings with: python convert_mongosh_queries.py
+"""
+
+import hashlib
+import orjson
+from bson import SON, json_util
+from pymongo.command_cursor import CommandCursor
+from pymongo.cursor import Cursor
+
+
+OPERATIONS = ('find', 'count_documents', 'aggregate', 'estimated_document_count')
+
+
+def _decode_ejson(value):
+    """Turn Extended JSON wrappers like {"$date": ...} into BSON types, innermost first."""
+    if isinstance(value, dict):
+        return json_util.object_hook({k: _decode_ejson(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_decode_ejson(v) for v in value]
+    return value
+
+
+def load_queries(queries_file):
+    """Load the queries file, decoding Extended JSON values into BSON types."""
+    with open(queries_file, 'rb') as f:
+        queries = _decode_ejson(orjson.loads(f.read()))
+    
+    for q in queries:
+        if not isinstance(q.get('query'), dict):
+            raise ValueError(
+                f"Query '{q.get('description')}' is not in structured form; "
+                f"run: python convert_mongosh_queries.py {queries_file}"
+            )
+        if q['query'].get('op') not in OPERATIONS:
+            raise ValueError(f"Query '{q.get('description')}' has unsupported op: {q['query'].get('op')}")
+    
+    return queries
+
+
+def format_query(spec):
+    """Render a query spec as a single line of Extended JSON for logs and reports."""
+    return json_util.dumps(spec)
+
+
+def _strip_literals(value):
+    if isinstance(value, dict):
+        return {k: _strip_literals(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_strip_literals(v) for v in value]
+    if isinstance(value, str) and value.startswith('$'):
+        # Field paths in pipeline stages are structure, not literals
+        return value
+    return '?'
+
+
+def shape_key(spec):
+    """Hash a query spec with literal values stripped.
+    
+    Queries that differ only in filter/pipeline literals (or limit/skip) share
+    a key; field names, operators, projection, sort and hint are kept.
+    """
+    args = spec.get('args', {})
+    shape = [
+        spec['op'],
+        spec.get('collection'),
+        _strip_literals(args.get('filter')),
+        _strip_literals(args.get('pipeline')),
+        args.get('projection'),
+        args.get('sort'),
+        args.get('hint'),
+    ]
+    return hashlib.blake2b(json_util.dumps(shape).encode(), digest_size=8).hexdigest()
+
+
+def run_operation(collection, spec):
+    """Execute a query spec through PyMongo, draining cursors like mongosh's toArray()."""
+    result = getattr(collection, spec['op'])(**spec.get('args', {}))
+    if isinstance(result, (Cursor, CommandCursor)):
+        return list(result)
+    return result
+
+
+def explain_command(collection_name, spec):
+    """Build the database command that `explain` should wrap for a query spec."""
+    op = spec['op']
+    args = spec.get('args', {})
+    
+    if op == 'find':
+        command = SON([('find', collection_name), ('filter', args.get('filter', {}))])
+        for key in ('projection', 'skip', 'limit'):
+            if key in args:
+                command[key] = args[key]
+        for key in ('sort', 'hint'):
+            if key in args:
+                command[key] = SON(args[key]) if isinstance(args[key], list) else args[key]
+        return command
+    
+    if op == 'count_documents':
+        # Same pipeline PyMongo's count_documents() sends
+        pipeline = [{'$match': args.get('filter', {})}]
+        if 'skip' in args:
+            pipeline.append({'$skip': args['skip']})
+        if 'limit' in args:
+            pipeline.append({'$limit': args['limit']})
+        pipeline.append({'$group': {'_id': 1, 'n': {'$sum': 1}}})
+        return SON([('aggregate', collection_name), ('pipeline', pipeline), ('cursor', {})])
+    
+    if op == 'aggregate':
+        return SON([('aggregate', collection_name), ('pipeline', args.get('pipeline', [])), ('cursor', {})])
+    
+    if op == 'estimated_document_count':
+        return SON([('count', collection_name)])
+    
+    raise ValueError(f"Unsupported operation: {op}")
@@ -8,14 +8,26 @@ Usage:
     python apply_schema.py --schema schema.json
 """
 
+import io
 import json
 import sys
 import os
+import re
+import orjson
 import subprocess
-import tempfile
 from dotenv import load_dotenv
 
 
+# Names made only of these characters can be emitted as plain single-quoted
+# JS strings; anything else (quotes, backslashes, newlines) is JSON-escaped
+_JS_PLAIN = re.compile(r"[\w.$ -]*")
+
+
+def _js_str(name: str) -> str:
+    """Quote a database/collection name as a JS string literal"""
+    return f"'{name}'" if _JS_PLAIN.fullmatch(name) else json.dumps(name)
+
+
 def load_config():
     """Load configuration from .env file"""
     load_dotenv()
@@ -39,8 +51,8 @@ def load_config():
 def load_schema(schema_file: str) -> dict:
     """Load schema from JSON file"""
     try:
-        with open(schema_file, 'r', encoding='utf-8') as f:
-            schema = json.load(f)
+        with open(schema_file, 'rb') as f:
+            schema = orjson.loads(f.read())
         print(f"✅ Loaded schema: {schema_file}")
         return schema
     except Exception as e:
@@ -53,184 +65,187 @@ def generate_apply_script(schema: dict, db_prefix: str) -> str:
     
     databases = schema.get('databases', [])
     
-    script_lines = [
-        "// Auto-generated schema creation script",
-        "// Apply complete MongoDB schema to destination",
-        "",
-        "print('============================================================');",
-        "print('Applying Schema to Destination MongoDB');",
-        "print('============================================================');",
-        f"print('Total Databases: {len(databases)}');",
-        f"print('Database Prefix: {db_prefix if db_prefix else 'None'}');",
-        "print('============================================================');",
-        "print('');",
-        "",
-        "var results = { databases: 0, collections: 0, indexes: 0, errors: [] };",
-        ""
-    ]
+    buf = io.StringIO()
+    w = buf.write
+    
+    # The script is wrapped in a function so mongosh does not echo the
+    # value of every statement while reading it from stdin
+    w(f"""// Auto-generated schema creation script
+// Apply complete MongoDB schema to destination
+(function() {{
+
+print('============================================================');
+print('Applying Schema to Destination MongoDB');
+print('============================================================');
+print('Total Databases: {len(databases)}');
+print('Database Prefix: ' + {_js_str(db_prefix) if db_prefix else "'None'"});
+print('============================================================');
+print('');
+
+var results = {{ databases: 0, collections: 0, indexes: 0, errors: [] }};
+var adminDb = db.getSiblingDB('admin');
+
+""")
     
     for db_info in databases:
         db_name = db_info['database']
         target_db_name = f"{db_prefix}{db_name}" if db_prefix else db_name
+        db_js = _js_str(target_db_name)
         
-        script_lines.extend([
-            f"// Database: {target_db_name}",
-            f"print('\\n📁 Database: {target_db_name}');",
-            f"var targetDb = db.getSiblingDB('{target_db_name}');",
-            ""
-        ])
+        w(f"""// Database: {db_js}
+print('\\n📁 Database: ' + {db_js});
+var targetDb = db.getSiblingDB({db_js});
+
+""")
         
         # Check if any collection is sharded
         has_sharded = any(coll.get('is_sharded', False) for coll in db_info['collections'])
         
         if has_sharded:
-            script_lines.extend([
-                f"// Enable sharding on database",
-                "try {",
-                f"    var adminDb = db.getSiblingDB('admin');",
-                f"    adminDb.runCommand({{ enableSharding: '{target_db_name}' }});",
-                f"    print('   ✅ Sharding enabled on database');",
-                "} catch(e) {",
-                "    // May already be enabled or not supported",
-                f"    print('   ⚠️  Could not enable sharding: ' + e.message);",
-                "}",
-                ""
-            ])
+            w(f"""// Enable sharding on database
+try {{
+    adminDb.runCommand({{ enableSharding: {db_js} }});
+    print('   ✅ Sharding enabled on database');
+}} catch(e) {{
+    // May already be enabled or not supported
+    print('   ⚠️  Could not enable sharding: ' + e.message);
+}}
+
+""")
         
         for coll in db_info['collections']:
             coll_name = coll['name']
+            coll_js = _js_str(coll_name)
+            ns_js = _js_str(f"{target_db_name}.{coll_name}")
             
-            script_lines.extend([
-                f"// Collection: {coll_name}",
-                f"print('   📄 Creating collection: {coll_name}');",
-                ""
-            ])
+            w(f"""// Collection: {coll_js}
+print('   📄 Creating collection: ' + {coll_js});
+var created = false;
+
+""")
             
             # Create collection
             if coll.get('is_sharded'):
                 shard_key_json = json.dumps(coll['shard_key'])
-                script_lines.extend([
-                    f"// Shard collection with key: {shard_key_json}",
-                    "try {",
-                    f"    targetDb.createCollection('{coll_name}');",
-                    f"    var adminDb = db.getSiblingDB('admin');",
-                    f"    adminDb.runCommand({{ shardCollection: '{target_db_name}.{coll_name}', key: {shard_key_json} }});",
-                    f"    print('      ✅ Collection created and sharded');",
-                    "    results.collections++;",
-                    "} catch(e) {",
-                    f"    print('      ❌ Error: ' + e.message);",
-                    f"    results.errors.push({{ db: '{target_db_name}', collection: '{coll_name}', error: e.message }});",
-                    "}",
-                    ""
-                ])
+                w(f"""// Shard collection with key: {shard_key_json}
+try {{
+    targetDb.createCollection({coll_js});
+    created = true;
+    adminDb.runCommand({{ shardCollection: {ns_js}, key: {shard_key_json} }});
+    print('      ✅ Collection created and sharded');
+    results.collections++;
+}} catch(e) {{
+    print('      ❌ Error: ' + e.message);
+    results.errors.push({{ db: {db_js}, collection: {coll_js}, error: e.message }});
+}}
+
+""")
             else:
-                script_lines.extend([
-                    "try {",
-                    f"    targetDb.createCollection('{coll_name}');",
-                    f"    print('      ✅ Collection created');",
-                    "    results.collections++;",
-                    "} catch(e) {",
-                    f"    print('      ❌ Error: ' + e.message);",
-                    f"    results.errors.push({{ db: '{target_db_name}', collection: '{coll_name}', error: e.message }});",
-                    "}",
-                    ""
-                ])
+                w(f"""try {{
+    targetDb.createCollection({coll_js});
+    created = true;
+    print('      ✅ Collection created');
+    results.collections++;
+}} catch(e) {{
+    print('      ❌ Error: ' + e.message);
+    results.errors.push({{ db: {db_js}, collection: {coll_js}, error: e.message }});
+}}
+
+""")
             
-            # Create indexes
-            if coll.get('indexes'):
-                script_lines.append(f"   // Creating {len(coll['indexes'])} indexes")
-                
-                for idx in coll['indexes']:
-                    # Skip _id index
-                    if idx['name'] == '_id_':
-                        continue
-                    
-                    idx_name = idx['name']
-                    idx_keys = json.dumps(idx['keys'])
-                    
-                    # Build index options
-                    options = [f"name: '{idx_name}'"]
-                    if idx.get('unique'):
-                        options.append("unique: true")
-                    if idx.get('sparse'):
-                        options.append("sparse: true")
-                    if idx.get('background'):
-                        options.append("background: true")
-                    if idx.get('expireAfterSeconds') is not None:
-                        options.append(f"expireAfterSeconds: {idx['expireAfterSeconds']}")
-                    
-                    options_str = ", ".join(options)
-                    
-                    script_lines.extend([
-                        "   try {",
-                        f"       targetDb.{coll_name}.createIndex({idx_keys}, {{ {options_str} }});",
-                        f"       print('      ✅ Index: {idx_name}');",
-                        "       results.indexes++;",
-                        "   } catch(e) {",
-                        f"       print('      ❌ Index {idx_name} failed: ' + e.message);",
-                        f"       results.errors.push({{ db: '{target_db_name}', collection: '{coll_name}', index: '{idx_name}', error: e.message }});",
-                        "   }",
-                        ""
-                    ])
+            # Create indexes with one createIndexes command per collection
+            idx_specs = []
+            for idx in coll.get('indexes', []):
+                # Skip _id index
+                if idx['name'] == '_id_':
+                    continue
                 
-                script_lines.append("")
+                spec = {'key': idx['keys'], 'name': idx['name']}
+                if idx.get('unique'):
+                    spec['unique'] = True
+                if idx.get('sparse'):
+                    spec['sparse'] = True
+                if idx.get('background'):
+                    spec['background'] = True
+                if idx.get('expireAfterSeconds') is not None:
+                    spec['expireAfterSeconds'] = idx['expireAfterSeconds']
+                idx_specs.append(spec)
+            
+            if idx_specs:
+                w(f"""   // Creating {len(idx_specs)} indexes
+   var idxSpecs = {json.dumps(idx_specs)};
+   // A collection created just above is empty, so build in the foreground
+   if (created) idxSpecs.forEach(function(spec) {{ delete spec.background; }});
+   try {{
+       var res = targetDb.runCommand({{ createIndexes: {coll_js}, indexes: idxSpecs }});
+       if (!res.ok) throw new Error(res.errmsg);
+       idxSpecs.forEach(function(spec) {{ print('      ✅ Index: ' + spec.name); }});
+       results.indexes += idxSpecs.length;
+   }} catch(e) {{
+       // One bad definition fails the batch; retry one at a time to find it
+       print('      ⚠️  Batch failed (' + e.message + '), creating indexes individually...');
+       idxSpecs.forEach(function(spec) {{
+           try {{
+               var res = targetDb.runCommand({{ createIndexes: {coll_js}, indexes: [spec] }});
+               if (!res.ok) throw new Error(res.errmsg);
+               print('      ✅ Index: ' + spec.name);
+               results.indexes++;
+           }} catch(e) {{
+               print('      ❌ Index ' + spec.name + ' failed: ' + e.message);
+               results.errors.push({{ db: {db_js}, collection: {coll_js}, index: spec.name, error: e.message }});
+           }}
+       }});
+   }}
+
+
+""")
         
-        script_lines.extend([
-            "results.databases++;",
-            ""
-        ])
+        w("""results.databases++;
+
+""")
     
-    script_lines.extend([
-        "print('');",
-        "print('============================================================');",
-        "print('Schema Application Complete');",
-        "print('============================================================');",
-        "print('Databases Created: ' + results.databases);",
-        "print('Collections Created: ' + results.collections);",
-        "print('Indexes Created: ' + results.indexes);",
-        "if (results.errors.length > 0) {",
-        "    print('Errors: ' + results.errors.length);",
-        "    print('');",
-        "    print('Error Details:');",
-        "    results.errors.forEach(function(err) {",
-        "        print('  - ' + JSON.stringify(err));",
-        "    });",
-        "}",
-        "print('============================================================');",
-        ""
-    ])
+    w("""print('');
+print('============================================================');
+print('Schema Application Complete');
+print('============================================================');
+print('Databases Created: ' + results.databases);
+print('Collections Created: ' + results.collections);
+print('Indexes Created: ' + results.indexes);
+if (results.errors.length > 0) {
+    print('Errors: ' + results.errors.length);
+    print('');
+    print('Error Details:');
+    results.errors.forEach(function(err) {
+        print('  - ' + JSON.stringify(err));
+    });
+}
+print('============================================================');
+})();
+""")
     
-    return "\n".join(script_lines)
+    return buf.getvalue()
 
 
 def apply_schema(config: dict, script: str):
     """Execute mongosh script to apply schema"""
     try:
-        # Create temporary file for the script
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False, encoding='utf-8') as tmp:
-            tmp.write(script)
-            tmp_path = tmp.name
-        
-        # Execute mongosh
-        cmd = ['mongosh', config['connection_string'], '--file', tmp_path, '--quiet']
+        # Execute mongosh, feeding the script on stdin instead of a temp file
+        cmd = ['mongosh', config['connection_string'], '--quiet']
         
+        # Output is captured as bytes and decoded once, only for printing
         result = subprocess.run(
             cmd,
+            input=script.encode('utf-8'),
             capture_output=True,
-            text=True,
-            encoding='utf-8',
             timeout=config['timeout']
         )
         
-        # Clean up temp file
-        os.unlink(tmp_path)
-        
         if result.returncode == 0:
-            print(result.stdout)
+            print(result.stdout.decode('utf-8', errors='replace'))
             return True
         else:
             print(f"❌ Error applying schema:")
-            print(result.stderr)
+            print(result.stderr.decode('utf-8', errors='replace'))
             return False
             
     except subprocess.TimeoutExpired:
@@ -257,21 +272,29 @@ def main():
     
     # Summary
     databases = schema.get('databases', [])
-    total_collections = sum(len(db['collections']) for db in databases)
-    total_indexes = sum(sum(len(coll['indexes']) for coll in db['collections']) for db in databases)
-    sharded_collections = sum(sum(1 for coll in db['collections'] if coll.get('is_sharded')) for db in databases)
+    total_collections = total_indexes = sharded_collections = 0
+    for db in databases:
+        for coll in db['collections']:
+            total_collections += 1
+            total_indexes += len(coll['indexes'])
+            if coll.get('is_sharded'):
+                sharded_collections += 1
     
-    print(f"\n📊 Schema Summary:")
-    print(f"   Databases: {len(databases)}")
-    print(f"   Collections: {total_collections}")
-    print(f"   Indexes: {total_indexes}")
-    print(f"   Sharded Collections: {sharded_collections}")
+    # Build the report first and write it with a single call
+    out = []
+    out.append(f"\n📊 Schema Summary:")
+    out.append(f"   Databases: {len(databases)}")
+    out.append(f"   Collections: {total_collections}")
+    out.append(f"   Indexes: {total_indexes}")
+    out.append(f"   Sharded Collections: {sharded_collections}")
     
     for db in databases:
-        print(f"\n   📁 {db['database']}")
+        out.append(f"\n   📁 {db['database']}")
         for coll in db['collections']:
             shard_info = " [SHARDED]" if coll.get('is_sharded') else ""
-            print(f"      - {coll['name']} ({len(coll['indexes'])} indexes){shard_info}")
+            out.append(f"      - {coll['name']} ({len(coll['indexes'])} indexes){shard_info}")
+    
+    sys.stdout.write("\n".join(out) + "\n")
     
     print(f"\n🔌 Connecting to destination and applying schema...\n")
     
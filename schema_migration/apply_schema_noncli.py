@@ -8,21 +8,31 @@ Usage:
     python apply_schema_noncli.py --schema schema.json
 
 Requirements:
-    pip install pymongo python-dotenv
+    pip install pymongo python-dotenv orjson
 """
 
+import atexit
 import json
 import sys
 import os
-from typing import Dict, List
+import traceback
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel
 from pymongo.errors import (
+    CollectionInvalid,
     ConnectionFailure, 
     OperationFailure, 
     ServerSelectionTimeoutError,
     ConfigurationError
 )
+from mongo_uri import mask_password
+
+
+# Shared by the worker threads; set by get_client()
+_client = None
 
 
 def load_config() -> Dict:
@@ -41,15 +51,33 @@ def load_config() -> Dict:
     return {
         'connection_string': connection_string,
         'db_prefix': db_prefix,
-        'timeout': int(os.getenv('TIMEOUT_SECONDS', '120')) * 1000  # Convert to milliseconds
+        'timeout': int(os.getenv('TIMEOUT_SECONDS', '120')) * 1000,  # Convert to milliseconds
+        'workers': int(os.getenv('APPLY_WORKERS', '8'))
     }
 
 
+def get_client(config: Dict) -> MongoClient:
+    """Return the shared MongoClient, connecting on first use"""
+    global _client
+    
+    if _client is None:
+        _client = MongoClient(
+            config['connection_string'],
+            maxPoolSize=max(16, config['workers']),
+            serverSelectionTimeoutMS=config['timeout'],
+            connectTimeoutMS=config['timeout'],
+            socketTimeoutMS=config['timeout']
+        )
+        atexit.register(_client.close)
+    
+    return _client
+
+
 def load_schema(schema_file: str) -> Dict:
     """Load schema from JSON file"""
     try:
-        with open(schema_file, 'r', encoding='utf-8') as f:
-            schema = json.load(f)
+        with open(schema_file, 'rb') as f:
+            schema = orjson.loads(f.read())
         print(f"✅ Loaded schema: {schema_file}")
         return schema
     except FileNotFoundError:
@@ -63,19 +91,185 @@ def load_schema(schema_file: str) -> Dict:
         sys.exit(1)
 
 
-def mask_password(connection_string: str) -> str:
-    """Mask password in connection string for logging"""
+def build_index_model(idx: Dict, log, created: bool = False) -> IndexModel:
+    """Build an IndexModel from an extracted index definition"""
+    index_options = {'name': idx['name']}
+    
+    if idx.get('unique'):
+        index_options['unique'] = True
+    if idx.get('sparse'):
+        index_options['sparse'] = True
+    # A collection created just before its indexes is empty, so a
+    # foreground build finishes synchronously; keep background otherwise
+    if idx.get('background') and not created:
+        index_options['background'] = True
+    
+    # Convert index keys to list of tuples
+    # MongoDB expects [(field, direction), ...]
+    # Handle string numeric values from JSON
+    index_spec = []
+    for field, direction in idx['keys'].items():
+        # Convert string numbers to int (e.g., "1" -> 1, "-1" -> -1)
+        if isinstance(direction, str):
+            if direction in ['1', '-1']:
+                direction = int(direction)
+            # Otherwise keep as string (e.g., 'text', '2d', 'hashed', '2dsphere')
+        elif isinstance(direction, (int, float)):
+            direction = int(direction)
+        index_spec.append((field, direction))
+    
+    # TTL indexes (expireAfterSeconds) only work on single-field indexes
+    # Check if this is a compound index with TTL
+    if idx.get('expireAfterSeconds') is not None:
+        if len(index_spec) > 1:
+            log(f"      ⚠️  Index {idx['name']}: TTL (expireAfterSeconds) only works on single-field indexes, skipping TTL on compound index")
+        else:
+            index_options['expireAfterSeconds'] = idx['expireAfterSeconds']
+    
+    return IndexModel(index_spec, **index_options)
+
+
+def create_index_one(collection, target_db_name: str, idx: Dict, model: IndexModel, outcome: Dict):
+    """Create a single index, recording the result in outcome"""
+    idx_name = idx['name']
+    log = outcome['log'].append
+    
     try:
-        if '@' in connection_string:
-            parts = connection_string.split('@')
-            if len(parts) >= 2 and '://' in parts[0]:
-                protocol_and_creds = parts[0]
-                if ':' in protocol_and_creds.split('//')[-1]:
-                    protocol_user = protocol_and_creds.rsplit(':', 1)[0]
-                    return f"{protocol_user}:***@{parts[1]}"
-        return connection_string
-    except:
-        return "***"
+        collection.create_indexes([model])
+        log(f"      ✅ Index: {idx_name}")
+        outcome['indexes'] += 1
+        
+    except OperationFailure as e:
+        error_msg = str(e)
+        if 'already exists' in error_msg.lower():
+            log(f"      ℹ️  Index {idx_name} already exists")
+            outcome['indexes'] += 1
+        else:
+            log(f"      ❌ Index {idx_name} failed: {error_msg}")
+            outcome['errors'].append({
+                'db': target_db_name,
+                'collection': collection.name,
+                'index': idx_name,
+                'error': error_msg
+            })
+    except Exception as e:
+        log(f"      ❌ Index {idx_name} failed: {e}")
+        outcome['errors'].append({
+            'db': target_db_name,
+            'collection': collection.name,
+            'index': idx_name,
+            'error': str(e)
+        })
+
+
+def apply_collection(client: MongoClient, target_db_name: str, coll_info: Dict) -> Dict:
+    """Create one collection (sharding it if needed) and its indexes.
+    
+    Runs on a worker thread, so progress lines are collected in the
+    returned 'log' and printed by the caller in schema order.
+    """
+    outcome = {'collections': 0, 'indexes': 0, 'errors': [], 'log': []}
+    log = outcome['log'].append
+    
+    target_db = client[target_db_name]
+    coll_name = coll_info['name']
+    log(f"   📄 Creating collection: {coll_name}")
+    created = False
+    
+    try:
+        # Create collection
+        if coll_info.get('is_sharded'):
+            # For sharded collections, create and then shard
+            shard_key = coll_info['shard_key']
+            
+            try:
+                # Create collection first
+                target_db.create_collection(coll_name)
+                created = True
+                
+                # Try to shard it
+                try:
+                    client.admin.command(
+                        'shardCollection',
+                        f"{target_db_name}.{coll_name}",
+                        key=shard_key
+                    )
+                    log(f"      ✅ Collection created and sharded")
+                except OperationFailure as e:
+                    log(f"      ⚠️  Collection created but sharding failed: {e}")
+                    log(f"      ℹ️  This is expected for Azure Cosmos DB (DocumentDB API)")
+            except CollectionInvalid:
+                # pymongo raises this when the collection already exists
+                log(f"      ℹ️  Collection already exists")
+        else:
+            # Regular (non-sharded) collection
+            try:
+                target_db.create_collection(coll_name)
+                created = True
+                log(f"      ✅ Collection created")
+            except CollectionInvalid:
+                log(f"      ℹ️  Collection already exists")
+        
+        outcome['collections'] += 1
+        
+    except Exception as e:
+        error_msg = f"Error creating collection: {e}"
+        log(f"      ❌ {error_msg}")
+        outcome['errors'].append({
+            'db': target_db_name,
+            'collection': coll_name,
+            'error': str(e)
+        })
+        return outcome
+    
+    # Create indexes (skip _id index, automatically created)
+    indexes = [idx for idx in coll_info.get('indexes', []) if idx['name'] != '_id_']
+    if indexes:
+        log(f"   // Creating {len(indexes)} indexes")
+        
+        collection = target_db[coll_name]
+        
+        # A malformed definition fails only its own index, not the batch
+        built = []
+        for idx in indexes:
+            try:
+                built.append((idx, build_index_model(idx, log, created)))
+            except Exception as e:
+                log(f"      ❌ Index {idx['name']} failed: {e}")
+                outcome['errors'].append({
+                    'db': target_db_name,
+                    'collection': coll_name,
+                    'index': idx['name'],
+                    'error': str(e)
+                })
+        indexes = [idx for idx, _ in built]
+        models = [model for _, model in built]
+    
+    if indexes:
+        try:
+            # Single createIndexes command for the whole collection
+            collection.create_indexes(models)
+            for idx in indexes:
+                log(f"      ✅ Index: {idx['name']}")
+            outcome['indexes'] += len(models)
+            
+        except OperationFailure as e:
+            # One bad or conflicting definition fails the whole batch;
+            # retry one at a time to report which index is at fault
+            log(f"      ⚠️  Batch failed ({e}), creating indexes individually...")
+            for idx, model in zip(indexes, models):
+                create_index_one(collection, target_db_name, idx, model, outcome)
+        except Exception as e:
+            log(f"      ❌ Index creation failed: {e}")
+            for idx in indexes:
+                outcome['errors'].append({
+                    'db': target_db_name,
+                    'collection': coll_name,
+                    'index': idx['name'],
+                    'error': str(e)
+                })
+    
+    return outcome
 
 
 def apply_schema(config: Dict, schema: Dict) -> bool:
@@ -95,180 +289,64 @@ def apply_schema(config: Dict, schema: Dict) -> bool:
     print(f"Total Databases: {len(databases)}")
     print(f"Database Prefix: {config['db_prefix'] if config['db_prefix'] else 'None'}")
     print(f"Connection: {mask_password(config['connection_string'])}")
+    print(f"Workers: {config['workers']}")
     print("============================================================")
     print("")
     
-    client = None
-    
     try:
         # Connect to MongoDB
         print("🔌 Connecting to destination server...")
-        client = MongoClient(
-            config['connection_string'],
-            serverSelectionTimeoutMS=config['timeout'],
-            connectTimeoutMS=config['timeout'],
-            socketTimeoutMS=config['timeout']
-        )
+        client = get_client(config)
         
         # Test connection
         client.admin.command('ping')
         print("✅ Connected successfully\n")
         
-        # Process each database
-        for db_info in databases:
-            db_name = db_info['database']
-            target_db_name = f"{config['db_prefix']}{db_name}" if config['db_prefix'] else db_name
-            
-            print(f"📁 Database: {target_db_name}")
-            
-            target_db = client[target_db_name]
+        with ThreadPoolExecutor(max_workers=config['workers']) as executor:
+            pending = []
             
-            # Check if any collection is sharded
-            has_sharded = any(coll.get('is_sharded', False) for coll in db_info['collections'])
-            
-            if has_sharded:
-                # Try to enable sharding on database
-                try:
-                    client.admin.command('enableSharding', target_db_name)
-                    print(f"   ✅ Sharding enabled on database")
-                except OperationFailure as e:
-                    # May already be enabled or not supported (e.g., DocumentDB)
-                    print(f"   ⚠️  Could not enable sharding: {e}")
-                except Exception as e:
-                    print(f"   ⚠️  Could not enable sharding: {e}")
-            
-            # Process each collection
-            for coll_info in db_info['collections']:
-                coll_name = coll_info['name']
-                print(f"   📄 Creating collection: {coll_name}")
+            # Process each database
+            for db_info in databases:
+                db_name = db_info['database']
+                target_db_name = f"{config['db_prefix']}{db_name}" if config['db_prefix'] else db_name
                 
-                try:
-                    # Create collection
-                    if coll_info.get('is_sharded'):
-                        # For sharded collections, create and then shard
-                        shard_key = coll_info['shard_key']
-                        
-                        try:
-                            # Create collection first
-                            target_db.create_collection(coll_name)
-                            
-                            # Try to shard it
-                            try:
-                                client.admin.command(
-                                    'shardCollection',
-                                    f"{target_db_name}.{coll_name}",
-                                    key=shard_key
-                                )
-                                print(f"      ✅ Collection created and sharded")
-                            except OperationFailure as e:
-                                print(f"      ⚠️  Collection created but sharding failed: {e}")
-                                print(f"      ℹ️  This is expected for Azure Cosmos DB (DocumentDB API)")
-                        except OperationFailure as e:
-                            if 'already exists' in str(e).lower():
-                                print(f"      ℹ️  Collection already exists")
-                            else:
-                                raise
-                    else:
-                        # Regular (non-sharded) collection
-                        try:
-                            target_db.create_collection(coll_name)
-                            print(f"      ✅ Collection created")
-                        except OperationFailure as e:
-                            if 'already exists' in str(e).lower():
-                                print(f"      ℹ️  Collection already exists")
-                            else:
-                                raise
-                    
-                    results['collections'] += 1
-                    
-                except Exception as e:
-                    error_msg = f"Error creating collection: {e}"
-                    print(f"      ❌ {error_msg}")
-                    results['errors'].append({
-                        'db': target_db_name,
-                        'collection': coll_name,
-                        'error': str(e)
-                    })
-                    continue
+                header = [f"📁 Database: {target_db_name}"]
+                
+                # Check if any collection is sharded
+                has_sharded = any(coll.get('is_sharded', False) for coll in db_info['collections'])
                 
-                # Create indexes
-                indexes = coll_info.get('indexes', [])
-                if indexes:
-                    print(f"   // Creating {len(indexes)} indexes")
-                    
-                    collection = target_db[coll_name]
-                    
-                    for idx in indexes:
-                        # Skip _id index (automatically created)
-                        if idx['name'] == '_id_':
-                            continue
-                        
-                        idx_name = idx['name']
-                        idx_keys = idx['keys']
-                        
-                        try:
-                            # Build index options
-                            index_options = {'name': idx_name}
-                            
-                            if idx.get('unique'):
-                                index_options['unique'] = True
-                            if idx.get('sparse'):
-                                index_options['sparse'] = True
-                            if idx.get('background'):
-                                index_options['background'] = True
-                            
-                            # Convert index keys to list of tuples
-                            # MongoDB expects [(field, direction), ...]
-                            # Handle string numeric values from JSON
-                            index_spec = []
-                            for field, direction in idx_keys.items():
-                                # Convert string numbers to int (e.g., "1" -> 1, "-1" -> -1)
-                                if isinstance(direction, str):
-                                    if direction in ['1', '-1']:
-                                        direction = int(direction)
-                                    # Otherwise keep as string (e.g., 'text', '2d', 'hashed', '2dsphere')
-                                elif isinstance(direction, (int, float)):
-                                    direction = int(direction)
-                                index_spec.append((field, direction))
-                            
-                            # TTL indexes (expireAfterSeconds) only work on single-field indexes
-                            # Check if this is a compound index with TTL
-                            if idx.get('expireAfterSeconds') is not None:
-                                if len(index_spec) > 1:
-                                    print(f"      ⚠️  Index {idx_name}: TTL (expireAfterSeconds) only works on single-field indexes, skipping TTL on compound index")
-                                else:
-                                    index_options['expireAfterSeconds'] = idx['expireAfterSeconds']
-                            
-                            # Create index
-                            collection.create_index(index_spec, **index_options)
-                            print(f"      ✅ Index: {idx_name}")
-                            results['indexes'] += 1
-                            
-                        except OperationFailure as e:
-                            error_msg = str(e)
-                            if 'already exists' in error_msg.lower():
-                                print(f"      ℹ️  Index {idx_name} already exists")
-                                results['indexes'] += 1
-                            else:
-                                print(f"      ❌ Index {idx_name} failed: {error_msg}")
-                                results['errors'].append({
-                                    'db': target_db_name,
-                                    'collection': coll_name,
-                                    'index': idx_name,
-                                    'error': error_msg
-                                })
-                        except Exception as e:
-                            print(f"      ❌ Index {idx_name} failed: {e}")
-                            results['errors'].append({
-                                'db': target_db_name,
-                                'collection': coll_name,
-                                'index': idx_name,
-                                'error': str(e)
-                            })
+                if has_sharded:
+                    # Sharding must be enabled before this database's
+                    # collections are submitted, so it runs here serially
+                    try:
+                        client.admin.command('enableSharding', target_db_name)
+                        header.append(f"   ✅ Sharding enabled on database")
+                    except OperationFailure as e:
+                        # May already be enabled or not supported (e.g., DocumentDB)
+                        header.append(f"   ⚠️  Could not enable sharding: {e}")
+                    except Exception as e:
+                        header.append(f"   ⚠️  Could not enable sharding: {e}")
                 
-                print("")
+                # Process each collection on the pool
+                futures = [
+                    executor.submit(apply_collection, client, target_db_name, coll_info)
+                    for coll_info in db_info['collections']
+                ]
+                pending.append((header, futures))
             
-            results['databases'] += 1
+            # Report in schema order as collections finish
+            for header, futures in pending:
+                print("\n".join(header))
+                
+                for future in futures:
+                    outcome = future.result()
+                    print("\n".join(outcome['log']))
+                    print("")
+                    results['collections'] += outcome['collections']
+                    results['indexes'] += outcome['indexes']
+                    results['errors'].extend(outcome['errors'])
+                
+                results['databases'] += 1
         
         # Print summary
         print("")
@@ -324,17 +402,14 @@ def apply_schema(config: Dict, schema: Dict) -> bool:
         return False
         
     except Exception as e:
-        print(f"\n❌ Unexpected error: {type(e).__name__}: {e}")
-        import traceback
-        print("\n--- Stack Trace ---")
-        traceback.print_exc()
-        print("--- End of Stack Trace ---")
+        # One stdout write keeps the trace in order with the status lines
+        sys.stdout.write(
+            f"\n❌ Unexpected error: {type(e).__name__}: {e}\n"
+            "\n--- Stack Trace ---\n"
+            f"{traceback.format_exc()}"
+            "--- End of Stack Trace ---\n"
+        )
         return False
-        
-    finally:
-        if client:
-            client.close()
-            print("\n🔌 Connection closed")
 
 
 def main():
@@ -364,28 +439,30 @@ def main():
     
     # Summary
     databases = schema.get('databases', [])
-    total_collections = sum(len(db['collections']) for db in databases)
-    total_indexes = sum(
-        sum(len(coll['indexes']) for coll in db['collections']) 
-        for db in databases
-    )
-    sharded_collections = sum(
-        sum(1 for coll in db['collections'] if coll.get('is_sharded')) 
-        for db in databases
-    )
+    total_collections = total_indexes = sharded_collections = 0
+    for db in databases:
+        for coll in db['collections']:
+            total_collections += 1
+            total_indexes += len(coll['indexes'])
+            if coll.get('is_sharded'):
+                sharded_collections += 1
     
-    print(f"📊 Schema Summary:")
-    print(f"   Databases: {len(databases)}")
-    print(f"   Collections: {total_collections}")
-    print(f"   Indexes: {total_indexes}")
-    print(f"   Sharded Collections: {sharded_collections}")
+    # Build the report first and write it with a single call
+    out = []
+    out.append(f"📊 Schema Summary:")
+    out.append(f"   Databases: {len(databases)}")
+    out.append(f"   Collections: {total_collections}")
+    out.append(f"   Indexes: {total_indexes}")
+    out.append(f"   Sharded Collections: {sharded_collections}")
     
     for db in databases:
-        print(f"\n   📁 {db['database']}")
+        out.append(f"\n   📁 {db['database']}")
         for coll in db['collections']:
             shard_info = " [SHARDED]" if coll.get('is_sharded') else ""
             idx_count = len(coll.get('indexes', []))
-            print(f"      - {coll['name']} ({idx_count} indexes){shard_info}")
+            out.append(f"      - {coll['name']} ({idx_count} indexes){shard_info}")
+    
+    sys.stdout.write("\n".join(out) + "\n")
     
     # Apply schema
     success = apply_schema(config, schema)
@@ -0,0 +1,22 @@
+"""
+Connection string helpers shared by the schema migration scripts
+"""
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=8)
+def mask_password(connection_string: str) -> str:
+    """Mask password in connection string for logging"""
+    scheme, sep, rest = connection_string.partition('://')
+    if not sep:
+        return connection_string
+    # Like pymongo, the host list ends at the first '/'; credentials end at
+    # its last '@', so a raw '#', '?' or '@' in a password is masked whole
+    # while an '@' in the database or options is left alone
+    authority, slash, path = rest.partition('/')
+    creds, at, hosts = authority.rpartition('@')
+    if not at or ':' not in creds:
+        return connection_string
+    user = creds.split(':', 1)[0]
+    return f"{scheme}://{user}:***@{hosts}{slash}{path}"
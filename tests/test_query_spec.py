@@ -0,0 +1,215 @@
+"""
+Tests for the structured query specs (query_spec.py) and the mongosh
+query converter (convert_mongosh_queries.py).
+
+Run from the repository root: python -m pytest -q
+"""
+
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+from bson import ObjectId, Regex, SON
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from convert_mongosh_queries import dump_queries, parse_query
+from query_spec import OPERATIONS, explain_command, load_queries
+
+DATA_FILES = ('mongodb_queries.json', 'mongodb_avetrack_queries.json')
+
+
+# explain_command
+
+def test_explain_find_with_modifiers():
+    spec = {'op': 'find', 'args': {
+        'filter': {'a': 1},
+        'projection': {'b': 1},
+        'sort': [('c', -1), ('d', 1)],
+        'hint': [('c', -1)],
+        'skip': 5,
+        'limit': 10,
+    }}
+    command = explain_command('coll', spec)
+    assert list(command.items())[:2] == [('find', 'coll'), ('filter', {'a': 1})]
+    assert command['projection'] == {'b': 1}
+    assert command['skip'] == 5 and command['limit'] == 10
+    # Key lists become ordered documents so field order survives
+    assert isinstance(command['sort'], SON)
+    assert list(command['sort'].items()) == [('c', -1), ('d', 1)]
+    assert list(command['hint'].items()) == [('c', -1)]
+
+
+def test_explain_find_defaults_to_empty_filter():
+    command = explain_command('coll', {'op': 'find', 'args': {}})
+    assert command == SON([('find', 'coll'), ('filter', {})])
+
+
+def test_explain_find_keeps_hint_by_name():
+    command = explain_command('coll', {'op': 'find', 'args': {'filter': {}, 'hint': 'a_1'}})
+    assert command['hint'] == 'a_1'
+
+
+def test_explain_count_documents_matches_pymongo_pipeline():
+    spec = {'op': 'count_documents', 'args': {'filter': {'a': 1}, 'skip': 2, 'limit': 3}}
+    command = explain_command('coll', spec)
+    assert command['aggregate'] == 'coll'
+    assert command['cursor'] == {}
+    assert command['pipeline'] == [
+        {'$match': {'a': 1}},
+        {'$skip': 2},
+        {'$limit': 3},
+        {'$group': {'_id': 1, 'n': {'$sum': 1}}},
+    ]
+
+
+def test_explain_aggregate():
+    pipeline = [{'$match': {'a': 1}}, {'$group': {'_id': '$b'}}]
+    command = explain_command('coll', {'op': 'aggregate', 'args': {'pipeline': pipeline}})
+    assert command == SON([('aggregate', 'coll'), ('pipeline', pipeline), ('cursor', {})])
+
+
+def test_explain_estimated_document_count():
+    command = explain_command('coll', {'op': 'estimated_document_count', 'args': {}})
+    assert command == SON([('count', 'coll')])
+
+
+def test_explain_rejects_unknown_op():
+    with pytest.raises(ValueError, match='Unsupported operation'):
+        explain_command('coll', {'op': 'delete_many', 'args': {}})
+
+
+# parse_query
+
+def test_parse_count_documents():
+    spec = parse_query("targetDb.{{collection}}.countDocuments({'fields.os': 'iOS', n: {$gte: 750}})")
+    assert spec == {'op': 'count_documents', 'args': {'filter': {'fields.os': 'iOS', 'n': {'$gte': 750}}}}
+
+
+def test_parse_modifier_chain():
+    spec = parse_query(
+        "targetDb.{{collection}}.find({a: 1}, {b: 1})"
+        ".sort({c: -1, d: 1}).hint({c: -1}).skip(5).limit(10).toArray();"
+    )
+    assert spec == {'op': 'find', 'args': {
+        'filter': {'a': 1},
+        'projection': {'b': 1},
+        'sort': [('c', -1), ('d', 1)],
+        'hint': [('c', -1)],
+        'skip': 5,
+        'limit': 10,
+    }}
+
+
+def test_parse_find_count_becomes_count_documents():
+    # cursor.count() ignores skip/limit unless applySkipLimit is passed
+    spec = parse_query("targetDb.{{collection}}.find({a: 1}, {b: 1}).sort({a: 1}).skip(2).limit(5).count()")
+    assert spec == {'op': 'count_documents', 'args': {'filter': {'a': 1}}}
+    spec = parse_query("targetDb.{{collection}}.find({a: 1}).skip(2).limit(5).count(true)")
+    assert spec == {'op': 'count_documents', 'args': {'filter': {'a': 1}, 'skip': 2, 'limit': 5}}
+
+
+def test_parse_aggregate_and_estimated_count():
+    spec = parse_query("targetDb.{{collection}}.aggregate([{$group: {_id: '$x', n: {$sum: 1}}}]).toArray()")
+    assert spec == {'op': 'aggregate', 'args': {'pipeline': [{'$group': {'_id': '$x', 'n': {'$sum': 1}}}]}}
+    assert parse_query("targetDb.{{collection}}.estimatedDocumentCount()") == {
+        'op': 'estimated_document_count', 'args': {}
+    }
+
+
+def test_parse_named_collection():
+    assert parse_query("targetDb.orders.find()")['collection'] == 'orders'
+    assert parse_query("targetDb.getCollection('my-orders').find()")['collection'] == 'my-orders'
+    assert 'collection' not in parse_query("targetDb.{{collection}}.find()")
+
+
+def test_parse_dates_and_object_ids():
+    spec = parse_query(
+        "targetDb.{{collection}}.find({d: ISODate('2024-01-01'), t: new Date('2024-01-02T03:04:05Z'),"
+        " _id: ObjectId('65a000000000000000000000')})"
+    )
+    filter_ = spec['args']['filter']
+    assert filter_['d'] == datetime(2024, 1, 1)
+    assert filter_['t'].isoformat() == '2024-01-02T03:04:05+00:00'
+    assert filter_['_id'] == ObjectId('65a000000000000000000000')
+    epoch = parse_query("targetDb.{{collection}}.find({d: new Date(86400000)})")['args']['filter']['d']
+    assert epoch.isoformat() == '1970-01-02T00:00:00+00:00'
+
+
+def test_parse_literals():
+    spec = parse_query("targetDb.{{collection}}.find({a: true, b: false, c: null, d: -1.5e3, e: [1, 'x']})")
+    assert spec['args']['filter'] == {'a': True, 'b': False, 'c': None, 'd': -1500.0, 'e': [1, 'x']}
+
+
+def test_parse_regex():
+    spec = parse_query(r"targetDb.{{collection}}.find({a: /^ab\/c.*/i, b: {$regex: '.*40[89].*'}})")
+    regex = spec['args']['filter']['a']
+    assert isinstance(regex, Regex)
+    assert regex == Regex(r'^ab/c.*', 'i')
+    assert spec['args']['filter']['b'] == {'$regex': '.*40[89].*'}
+
+
+def test_parse_string_escapes():
+    spec = parse_query(r"""targetDb.{{collection}}.find({a: 'x\ny\t\'q\\z', b: "\x41é\"" })""")
+    assert spec['args']['filter'] == {'a': "x\ny\t'q\\z", 'b': 'Aé"'}
+
+
+@pytest.mark.parametrize('query, message', [
+    ("db.coll.find()", 'Unsupported query'),
+    ("targetDb.{{collection}}.deleteMany({})", 'Unsupported method'),
+    ("targetDb.{{collection}}.aggregate([]).limit(5)", r'Unsupported modifier \.limit\(\)'),
+    ("targetDb.{{collection}}.find({a: 'x})", 'Unterminated string'),
+    ("targetDb.{{collection}}.find({a: /x})", 'Unterminated regex'),
+    ("targetDb.{{collection}}.find({a: '\\x4'})", r'Invalid \\x escape'),
+    ("targetDb.{{collection}}.find({a: UUID('x')})", 'Unsupported literal'),
+    ("targetDb.{{collection}}.find({a: 1}) extra", 'Unexpected trailing input'),
+    ("targetDb.{{collection}}.find({", 'Expected identifier'),
+    ("targetDb.{{collection}}.find({a: ", 'Unexpected end of input'),
+    ("targetDb.{{collection}}.find({a: ObjectId('zz')})", 'Invalid ObjectId'),
+    ("targetDb.{{collection}}.find({a: Date()})", "Date\\(\\) without 'new'"),
+    ("targetDb.{{collection}}.find({a: new Date()})", 'exactly one argument'),
+    ("targetDb.{{collection}}.find({a: ISODate('x')})", r'Invalid ISODate\(\) argument'),
+    ("targetDb.getCollection().find()", 'getCollection'),
+])
+def test_parse_errors(query, message):
+    with pytest.raises(ValueError, match=message):
+        parse_query(query)
+
+
+# data files
+
+def _baseline_file(name):
+    """The data file as first committed, with mongosh query strings"""
+    try:
+        root_commit = subprocess.run(
+            ['git', 'rev-list', '--max-parents=0', 'HEAD'],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.split()[-1]
+        return subprocess.run(
+            ['git', 'show', f'{root_commit}:data/{name}'],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, IndexError, subprocess.CalledProcessError):
+        pytest.skip('baseline query strings need a git checkout')
+
+
+@pytest.mark.parametrize('name', DATA_FILES)
+def test_baseline_queries_convert_to_committed_file(name):
+    queries = json.loads(_baseline_file(name))
+    assert all(isinstance(q['query'], str) for q in queries)
+    for q in queries:
+        q['query'] = parse_query(q['query'])
+
+    with open(os.path.join(ROOT, 'data', name), encoding='utf-8') as f:
+        assert dump_queries(queries) == f.read()
+
+
+@pytest.mark.parametrize('name', DATA_FILES)
+def test_committed_queries_load_and_build_explain_commands(name):
+    for q in load_queries(os.path.join(ROOT, 'data', name)):
+        assert q['query']['op'] in OPERATIONS
+        explain_command('coll', q['query'])